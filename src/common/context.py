@@ -0,0 +1,34 @@
+import configparser
+import os
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+from src.database.manager import DatabaseManager, pool_settings_from_config
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
+
+
+@dataclass(frozen=True)
+class AppContext:
+    config: configparser.ConfigParser
+    db_manager: DatabaseManager
+
+
+@lru_cache(maxsize=None)
+def get_context() -> AppContext:
+    """
+    Reads config.ini and builds the DatabaseManager once per process, so every stage run
+    from the same interpreter (as the orchestrator does) shares one engine and its pool.
+    """
+    load_dotenv()
+    config = configparser.ConfigParser()
+    config.read(PROJECT_ROOT / "config" / "config.ini")
+
+    db_connection_string = os.path.expandvars(config["DATABASE"]["connection_string"])
+    db_manager = DatabaseManager(
+        db_connection_string, **pool_settings_from_config(config["DATABASE"])
+    )
+    return AppContext(config=config, db_manager=db_manager)
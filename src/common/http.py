@@ -0,0 +1,33 @@
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+def build_session(
+    pool_size: int = 10,
+    retries: int = 3,
+    backoff_factor: float = 0.3,
+    status_forcelist: tuple[int, ...] = RETRY_STATUSES,
+    respect_retry_after_header: bool = True,
+) -> requests.Session:
+    """
+    Creates a requests.Session whose keep-alive pool holds pool_size connections per host
+    and which retries connection errors and the transient status_forcelist responses with backoff.
+    urllib3 also retries any 413/429/503 carrying a Retry-After header unless
+    respect_retry_after_header is False.
+    """
+    retry = Retry(
+        total=retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=status_forcelist,
+        respect_retry_after_header=respect_retry_after_header,
+        allowed_methods=("GET",),
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
@@ -1,23 +1,36 @@
+import atexit
 import logging
+import queue
 import sys
+from logging.handlers import MemoryHandler, QueueHandler, QueueListener
 
 def setup_logger(name, log_file, level=logging.INFO):
     """Function to setup as many loggers as you want"""
-    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-
-    # Console handler
-    stdout_handler = logging.StreamHandler(sys.stdout)
-    stdout_handler.setFormatter(formatter)
-
-    # File handler
-    file_handler = logging.FileHandler(log_file)
-    file_handler.setFormatter(formatter)
-
     logger = logging.getLogger(name)
     logger.setLevel(level)
-    
+
     if not logger.handlers:
-        logger.addHandler(stdout_handler)
-        logger.addHandler(file_handler)
+        formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+        # Console handler
+        stdout_handler = logging.StreamHandler(sys.stdout)
+        stdout_handler.setFormatter(formatter)
+
+        # File handler, buffered so the disk is only hit every 1024 records or on an error
+        file_handler = logging.FileHandler(log_file)
+        file_handler.setFormatter(formatter)
+        memory_handler = MemoryHandler(1024, flushLevel=logging.ERROR, target=file_handler)
+
+        # The calling thread only enqueues records; a background listener does the actual I/O
+        log_queue = queue.Queue(-1)
+        listener = QueueListener(log_queue, stdout_handler, memory_handler)
+        listener.start()
+        logger.addHandler(QueueHandler(log_queue))
+
+        def _flush_on_exit():
+            listener.stop()
+            memory_handler.flush()
+
+        atexit.register(_flush_on_exit)
 
     return logger
@@ -0,0 +1,45 @@
+import threading
+import time
+
+
+class RateLimiter:
+    """
+    Thread-safe token bucket. Each `with limiter:` block takes one token, waiting for a
+    refill when the bucket is empty, so callers run at the provider's quota instead of
+    sleeping a fixed amount between requests.
+    """
+
+    def __init__(self, rate: float, capacity: int | None = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1, int(rate))
+        self.tokens = float(self.capacity)
+        self.updated_at = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                if now > self.updated_at:
+                    self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                    self.updated_at = now
+                if now >= self.blocked_until and self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = max(self.blocked_until - now, (1 - self.tokens) / self.rate)
+            time.sleep(wait)
+
+    def pause(self, seconds: float):
+        """Holds back every caller for `seconds`, e.g. after the provider reported a rate limit."""
+        with self.lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+            self.tokens = 0.0
+            self.updated_at = self.blocked_until
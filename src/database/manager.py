@@ -1,41 +1,312 @@
+import csv
+import io
 import logging
-from sqlalchemy import create_engine, select, func
-from sqlalchemy.orm import sessionmaker
+from collections.abc import Iterable
+from contextlib import contextmanager
+from functools import lru_cache
+from itertools import islice
+from sqlalchemy import Select, bindparam, column, create_engine, select, func, insert, make_url, table, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session, sessionmaker
 from .models import (
     Base,
     Security,
     DailyPriceHistory,
     OneMinuteHistory,
 )  # Add OneMinuteHistory
-from datetime import datetime  # Add datetime
+from datetime import date, datetime  # Add datetime
 
 logger = logging.getLogger(__name__)
 
+# Rows per multi-row INSERT; keeps each statement well under driver parameter limits.
+BULK_INSERT_CHUNK_SIZE = 1000
+
+# Above this many rows bulk_insert switches to COPY FROM STDIN on psycopg2.
+COPY_THRESHOLD = 5000
+# NULL marker in COPY CSV data; an unquoted empty field then loads as an empty string.
+_COPY_NULL = "\\N"
+
+# Hot per-security lookups, built once so every call reuses the same cached compiled SQL.
+_ACTIVE_SECURITY_BY_SYMBOL = select(Security).where(
+    Security.symbol == bindparam("symbol"), Security.valid_to.is_(None)
+)
+_LAST_DAILY_DATE = select(func.max(DailyPriceHistory.price_date)).where(
+    DailyPriceHistory.security_id == bindparam("security_id")
+)
+_LAST_INTRADAY_TIMESTAMP = select(func.max(OneMinuteHistory.price_timestamp)).where(
+    OneMinuteHistory.security_id == bindparam("security_id")
+)
+
+
+def pool_settings_from_config(section) -> dict:
+    """Reads the optional connection-pool keys from a config section such as config['DATABASE']."""
+    return {
+        "pool_size": section.getint("pool_size", 25),
+        "max_overflow": section.getint("max_overflow", 25),
+        "pool_timeout": section.getint("pool_timeout", 30),
+        "pool_recycle": section.getint("pool_recycle", 1800),
+    }
+
+
+def _engine_options(connection_string: str, pool_settings: dict) -> dict:
+    """Driver-specific create_engine() options for fast bulk writes and pooled connections."""
+    url = make_url(connection_string)
+    # Room for every distinct statement the loaders issue, so none is ever recompiled.
+    options = {"query_cache_size": 1200}
+    if url.get_backend_name() != "sqlite":
+        # SQLite keeps SQLAlchemy's default pool; a sized QueuePool only pays off for server databases.
+        options.update(pool_settings, pool_pre_ping=True)
+    if url.get_backend_name() == "postgresql" and url.get_driver_name() == "psycopg2":
+        # Send executemany() as multi-VALUES pages instead of one execute() per row.
+        options.update(
+            executemany_mode="values_plus_batch",
+            insertmanyvalues_page_size=1000,
+            executemany_batch_page_size=500,
+        )
+    return options
+
+
+@lru_cache(maxsize=None)
+def _shared_engine(connection_string: str, **pool_settings):
+    """
+    One engine per connection string and pool settings, so every DatabaseManager built for the
+    same database in this process shares its connection pool instead of opening a new one.
+    """
+    return create_engine(connection_string, **_engine_options(connection_string, pool_settings))
+
 
 class DatabaseManager:
-    def __init__(self, connection_string: str):
-        self.engine = create_engine(connection_string)
+    def __init__(
+        self,
+        connection_string: str,
+        pool_size: int = 25,
+        max_overflow: int = 25,
+        pool_timeout: int = 30,
+        pool_recycle: int = 1800,
+    ):
+        pool_settings = {
+            "pool_size": pool_size,
+            "max_overflow": max_overflow,
+            "pool_timeout": pool_timeout,
+            "pool_recycle": pool_recycle,
+        }
+        self.engine = _shared_engine(connection_string, **pool_settings)
         self.Session = sessionmaker(bind=self.engine)
+        # For bulk-load paths that only run Core statements: no autoflush before each query
+        # and no expiring (and later reloading) of loaded objects after commit.
+        self.BulkSession = sessionmaker(bind=self.engine, autoflush=False, expire_on_commit=False)
         logger.info("DatabaseManager initialized.")
 
     def create_tables(self):
         Base.metadata.create_all(self.engine)
         logger.info("Database tables checked/created successfully.")
 
-    def get_security_by_symbol(self, symbol: str) -> Security | None:
-        with self.Session() as session:
-            stmt = select(Security).where(
-                Security.symbol == symbol, Security.valid_to.is_(None)
-            )
-            return session.execute(stmt).scalar_one_or_none()
+    @contextmanager
+    def scoped_session(self, session: Session | None = None):
+        """
+        Yields the caller's session when one is given, otherwise a fresh session that is
+        closed on exit. Lets helpers share one connection and transaction across a bulk loop.
+        """
+        if session is not None:
+            yield session
+            return
+        with self.Session() as new_session:
+            yield new_session
+
+    def get_security_by_symbol(self, symbol: str, session: Session | None = None) -> Security | None:
+        with self.scoped_session(session) as session:
+            return session.execute(
+                _ACTIVE_SECURITY_BY_SYMBOL, {"symbol": symbol}
+            ).scalar_one_or_none()
 
-    def bulk_insert(self, model_class, data: list[dict]):
+    def bulk_insert(self, model_class, data: list[dict], session: Session | None = None):
         if not data:
             return
-        with self.Session() as session:
+        if len(data) > COPY_THRESHOLD and self.supports_copy():
+            self.copy_insert(model_class, data, session)
+        else:
+            self._execute_in_chunks(insert(model_class), model_class, data, session)
+
+    def bulk_insert_iter(
+        self, model_class, rows: Iterable[dict], batch_size: int = BULK_INSERT_CHUNK_SIZE, session: Session | None = None
+    ):
+        """
+        Like bulk_insert, but pulls rows from an iterable batch_size at a time, so only one
+        batch of row dicts is ever alive.
+        """
+        rows = iter(rows)
+        stmt = insert(model_class)
+        inserted = 0
+        with self.scoped_session(session) as session:
             try:
-                session.bulk_insert_mappings(model_class, data)
+                while batch := list(islice(rows, batch_size)):
+                    session.execute(stmt, batch)
+                    session.commit()
+                    inserted += len(batch)
+                if inserted:
+                    logger.info(
+                        f"Successfully inserted {inserted} records into {model_class.__tablename__}."
+                    )
+            except Exception as e:
+                logger.error(
+                    f"Error during bulk insert for {model_class.__tablename__}: {e}"
+                )
+                session.rollback()
+
+    def supports_copy(self) -> bool:
+        return self.engine.dialect.name == "postgresql" and self.engine.dialect.driver == "psycopg2"
+
+    def copy_insert(self, model_class, data: list[dict], session: Session | None = None):
+        """
+        Streams rows into the model's table with PostgreSQL COPY ... FROM STDIN as CSV,
+        skipping per-statement parse/bind work. Requires the psycopg2 driver; every row
+        must carry the same keys as the first one.
+        """
+        with self.scoped_session(session) as session:
+            try:
+                self.copy_rows(session, model_class.__tablename__, data)
                 session.commit()
+                logger.info(
+                    f"Successfully copied {len(data)} records into {model_class.__tablename__}."
+                )
+            except Exception as e:
+                logger.error(f"Error during COPY for {model_class.__tablename__}: {e}")
+                session.rollback()
+
+    def copy_rows(self, session: Session, table_name: str, data: list[dict]):
+        """COPYs rows into table_name inside the session's current transaction, without committing."""
+        columns = list(data[0].keys())
+        self._copy_csv(session, table_name, columns, ([row[col] for col in columns] for row in data))
+
+    def copy_columns(self, model_class, columns: dict[str, list], session: Session | None = None):
+        """
+        Like copy_insert, but takes column-oriented data ({column name: values}) so callers
+        holding whole columns, such as a candle array, never build a dict per row.
+        """
+        with self.scoped_session(session) as session:
+            try:
+                self._copy_csv(session, model_class.__tablename__, list(columns), zip(*columns.values()))
+                session.commit()
+                logger.info(
+                    f"Successfully copied {len(next(iter(columns.values())))} records into {model_class.__tablename__}."
+                )
+            except Exception as e:
+                logger.error(f"Error during COPY for {model_class.__tablename__}: {e}")
+                session.rollback()
+
+    def _copy_csv(self, session: Session, table_name: str, columns: list[str], rows):
+        # csv.writer writes None and '' alike as an empty field, which COPY would read back as
+        # NULL for both; None is sent as an explicit \N marker so '' stays an empty string.
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(
+            [_COPY_NULL if value is None else value for value in row] for row in rows
+        )
+        buffer.seek(0)
+
+        quote = self.engine.dialect.identifier_preparer.quote
+        copy_sql = (
+            f"COPY {quote(table_name)} ({', '.join(quote(col) for col in columns)}) "
+            f"FROM STDIN WITH (FORMAT csv, NULL '{_COPY_NULL}')"
+        )
+        dbapi_connection = session.connection().connection
+        with dbapi_connection.cursor() as cursor:
+            cursor.copy_expert(copy_sql, buffer)
+
+    def staged_copy_insert(
+        self,
+        session: Session,
+        model_class,
+        data: list[dict],
+        conflict_cols: list[str],
+        returning: list | None = None,
+    ) -> list[tuple]:
+        """
+        COPYs rows into a temporary staging table, then moves them into the model's table with
+        one INSERT ... SELECT ... ON CONFLICT DO NOTHING and returns the `returning` columns of
+        the rows actually inserted (an empty list when returning is not given). The staging table
+        is dropped when the transaction commits, so the caller must commit. Requires the
+        psycopg2 driver.
+        """
+        columns = list(data[0].keys())
+        source = model_class.__tablename__
+        stage_name = f"{source}_stage"
+        quote = self.engine.dialect.identifier_preparer.quote
+        session.execute(
+            text(
+                f"CREATE TEMP TABLE IF NOT EXISTS {quote(stage_name)} ON COMMIT DROP AS "
+                f"SELECT {', '.join(quote(col) for col in columns)} FROM {quote(source)} WITH NO DATA"
+            )
+        )
+        # The staging table lives until commit, so later batches in the same transaction reuse it
+        session.execute(text(f"TRUNCATE {quote(stage_name)}"))
+        self.copy_rows(session, stage_name, data)
+
+        stage = table(stage_name, *[column(col) for col in columns])
+        stmt = (
+            pg_insert(model_class)
+            .from_select(columns, select(*[stage.c[col] for col in columns]))
+            .on_conflict_do_nothing(index_elements=conflict_cols)
+        )
+        if not returning:
+            session.execute(stmt)
+            return []
+        return session.execute(stmt.returning(*returning)).tuples().all()
+
+    def bulk_upsert(
+        self,
+        model_class,
+        data: list[dict],
+        conflict_cols: list[str],
+        session: Session | None = None,
+        raise_on_error: bool = False,
+    ):
+        """
+        Inserts rows, silently skipping any that collide with an existing row on conflict_cols
+        (which must be covered by a unique constraint). Large batches on psycopg2 are COPYed
+        through a staging table. Falls back to a plain insert on backends without ON CONFLICT
+        support. Errors are logged and the transaction rolled back; with raise_on_error they
+        are re-raised afterwards.
+        """
+        if not data:
+            return
+        if len(data) > COPY_THRESHOLD and self.supports_copy():
+            with self.scoped_session(session) as session:
+                try:
+                    self.staged_copy_insert(session, model_class, data, conflict_cols)
+                    session.commit()
+                    logger.info(
+                        f"Successfully copied {len(data)} records into {model_class.__tablename__}."
+                    )
+                except Exception as e:
+                    logger.error(f"Error during COPY upsert for {model_class.__tablename__}: {e}")
+                    session.rollback()
+                    if raise_on_error:
+                        raise
+            return
+        self._execute_in_chunks(
+            self.insert_ignoring_conflicts(model_class, conflict_cols), model_class, data, session, raise_on_error
+        )
+
+    def insert_ignoring_conflicts(self, model_class, conflict_cols: list[str]):
+        """INSERT statement for the model that skips rows colliding on conflict_cols, where the backend allows it."""
+        dialect = self.engine.dialect.name
+        if dialect == "postgresql":
+            return pg_insert(model_class).on_conflict_do_nothing(index_elements=conflict_cols)
+        if dialect == "sqlite":
+            return sqlite_insert(model_class).on_conflict_do_nothing(index_elements=conflict_cols)
+        logger.warning(f"ON CONFLICT is not supported for {dialect}; using a plain insert.")
+        return insert(model_class)
+
+    def _execute_in_chunks(
+        self, stmt, model_class, data: list[dict], session: Session | None, raise_on_error: bool = False
+    ):
+        with self.scoped_session(session) as session:
+            try:
+                for start in range(0, len(data), BULK_INSERT_CHUNK_SIZE):
+                    chunk = data[start : start + BULK_INSERT_CHUNK_SIZE]
+                    session.execute(stmt, chunk)
+                    session.commit()
                 logger.info(
                     f"Successfully inserted {len(data)} records into {model_class.__tablename__}."
                 )
@@ -44,28 +315,52 @@ class DatabaseManager:
                     f"Error during bulk insert for {model_class.__tablename__}: {e}"
                 )
                 session.rollback()
+                if raise_on_error:
+                    raise
 
-    def get_last_daily_update(self, security_id: int) -> datetime | None:
+    def get_last_daily_update(self, security_id: int, session: Session | None = None) -> datetime | None:
         """Finds the most recent date for a given security in the daily history table."""
-        with self.Session() as session:
-            last_date = (
-                session.query(func.max(DailyPriceHistory.price_date))
-                .filter(DailyPriceHistory.security_id == security_id)
-                .scalar()
-            )
+        with self.scoped_session(session) as session:
+            last_date = session.execute(
+                _LAST_DAILY_DATE, {"security_id": security_id}
+            ).scalar()
             return (
                 datetime.combine(last_date, datetime.min.time()) if last_date else None
             )
 
-    def get_last_intraday_update(self, security_id: int) -> datetime | None:
+    def get_last_daily_dates(
+        self, security_ids: list[int] | Select | None = None, session: Session | None = None
+    ) -> dict[int, date]:
+        """Finds the most recent date of every active security (or of security_ids) in the daily history table in one query."""
+        return self._last_updates(DailyPriceHistory.security_id, DailyPriceHistory.price_date, security_ids, session)
+
+    def get_last_intraday_timestamps(
+        self, security_ids: list[int] | Select | None = None, session: Session | None = None
+    ) -> dict[int, datetime]:
+        """Finds the most recent timestamp of every active security (or of security_ids) in the 1-min history table in one query."""
+        return self._last_updates(OneMinuteHistory.security_id, OneMinuteHistory.price_timestamp, security_ids, session)
+
+    def _last_updates(self, security_col, time_col, security_ids, session: Session | None) -> dict:
+        """
+        Walks the securities (security_ids, given as a list or a SELECT of ids, or else every
+        active one) and takes a correlated MAX() per security, so each is one probe of the
+        history table's unique index instead of a GROUP BY over the whole table.
+        Securities without history are left out of the result.
+        """
+        last_update = select(func.max(time_col)).where(security_col == Security.id).scalar_subquery()
+        stmt = select(Security.id, last_update)
+        if security_ids is None:
+            stmt = stmt.where(Security.valid_to.is_(None))
+        else:
+            stmt = stmt.where(Security.id.in_(security_ids))
+        with self.scoped_session(session) as session:
+            return {security_id: last for security_id, last in session.execute(stmt) if last is not None}
+
+    def get_last_intraday_update(self, security_id: int, session: Session | None = None) -> datetime | None:
         """Finds the most recent timestamp for a given security in the 1-min history table."""
-        with self.Session() as session:
-            last_date = (
-                session.query(func.max(OneMinuteHistory.price_timestamp))
-                .filter(OneMinuteHistory.security_id == security_id)
-                .scalar()
-            )
-            logger.info(
-                f"get_last_intraday_update for security_id {security_id}: {last_date}"
-            )
+        with self.scoped_session(session) as session:
+            last_date = session.execute(
+                _LAST_INTRADAY_TIMESTAMP, {"security_id": security_id}
+            ).scalar()
+            logger.debug("get_last_intraday_update for security_id %s: %s", security_id, last_date)
             return last_date
@@ -1,6 +1,6 @@
 from sqlalchemy import (
-    Column, Integer, String, Date, DateTime, Numeric, BigInteger,
-    ForeignKey, UniqueConstraint
+    Column, Integer, String, Date, DateTime, Numeric, Float, BigInteger,
+    ForeignKey, UniqueConstraint, Index
 )
 from sqlalchemy.orm import declarative_base, relationship
 from sqlalchemy.sql import func
@@ -21,6 +21,13 @@ class Security(Base):
     isin = Column(String, nullable=True, unique=True)
     valid_from = Column(DateTime, nullable=False, server_default=func.now())
     valid_to = Column(DateTime, nullable=True)
+    __table_args__ = (
+        # Serves the price loader's "active securities of these types" scan; covers id and symbol
+        Index(
+            'ix_securities_active_type', security_type,
+            postgresql_where=valid_to.is_(None), postgresql_include=['id', 'symbol'],
+        ),
+    )
 
     # Define the "one" side of the relationships to child tables
     equity_meta = relationship("SecuritiesEquityMeta", back_populates="security", uselist=False, cascade="all, delete-orphan")
@@ -72,10 +79,10 @@ class DailyPriceHistory(Base):
     id = Column(Integer, primary_key=True, autoincrement=True)
     security_id = Column(Integer, ForeignKey('securities.id'), nullable=False)
     price_date = Column(Date, nullable=False)
-    open = Column(Numeric(12, 4), nullable=True)
-    high = Column(Numeric(12, 4), nullable=True)
-    low = Column(Numeric(12, 4), nullable=True)
-    close = Column(Numeric(12, 4), nullable=False)
+    open = Column(Float, nullable=True)
+    high = Column(Float, nullable=True)
+    low = Column(Float, nullable=True)
+    close = Column(Float, nullable=False)
     volume = Column(BigInteger, nullable=True)
     __table_args__ = (UniqueConstraint('security_id', 'price_date', name='uq_daily_price'),)
 
@@ -91,10 +98,10 @@ class OneMinuteHistory(Base):
     id = Column(Integer, primary_key=True, autoincrement=True)
     security_id = Column(Integer, ForeignKey('securities.id'), nullable=False)
     price_timestamp = Column(DateTime, nullable=False)
-    open = Column(Numeric(12, 4), nullable=False)
-    high = Column(Numeric(12, 4), nullable=False)
-    low = Column(Numeric(12, 4), nullable=False)
-    close = Column(Numeric(12, 4), nullable=False)
+    open = Column(Float, nullable=False)
+    high = Column(Float, nullable=False)
+    low = Column(Float, nullable=False)
+    close = Column(Float, nullable=False)
     volume = Column(BigInteger, nullable=False)
     __table_args__ = (UniqueConstraint('security_id', 'price_timestamp', name='uq_one_minute_price'),)
 
@@ -111,10 +118,10 @@ class AggregatedIntradayHistory(Base):
     security_id = Column(Integer, ForeignKey('securities.id'), nullable=False)
     timeframe = Column(String(10), nullable=False)
     price_timestamp = Column(DateTime, nullable=False)
-    open = Column(Numeric(12, 4), nullable=False)
-    high = Column(Numeric(12, 4), nullable=False)
-    low = Column(Numeric(12, 4), nullable=False)
-    close = Column(Numeric(12, 4), nullable=False)
+    open = Column(Float, nullable=False)
+    high = Column(Float, nullable=False)
+    low = Column(Float, nullable=False)
+    close = Column(Float, nullable=False)
     volume = Column(BigInteger, nullable=False)
     __table_args__ = (UniqueConstraint('security_id', 'timeframe', 'price_timestamp', name='uq_agg_intraday_price'),)
 
@@ -0,0 +1,106 @@
+import logging
+import queue
+import threading
+import time
+
+from .manager import DatabaseManager
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class WriterThread(threading.Thread):
+    """
+    Single background writer that coalesces the rows pushed by many producers and stores
+    them with one bulk upsert per flush, instead of one small transaction per producer.
+    A flush happens once flush_rows rows are buffered or flush_interval seconds have passed.
+    With max_pending set, put() blocks while that many batches are waiting, so fast producers
+    cannot run ahead of the database without bound.
+    After the first failed flush nothing more is written, and put() and close() raise.
+    """
+
+    def __init__(
+        self,
+        db_manager: DatabaseManager,
+        model_class,
+        conflict_cols: list[str],
+        flush_rows: int = 10_000,
+        flush_interval: float = 2.0,
+        max_pending: int = 0,
+    ):
+        super().__init__(name=f"{model_class.__tablename__}-writer", daemon=True)
+        self.db_manager = db_manager
+        self.model_class = model_class
+        self.conflict_cols = conflict_cols
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.q = queue.Queue(maxsize=max_pending)
+        self.error = None
+        self._stopped = False
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def put(self, rows: list[dict]):
+        """Queues rows for the next flush. Raises once a flush has failed."""
+        self.raise_if_failed()
+        if rows:
+            self.q.put(rows)
+
+    def close(self):
+        """Flushes whatever is still buffered and waits for the thread to finish. Raises if a flush failed."""
+        self.q.put(_STOP)
+        self.join()
+        self.raise_if_failed()
+
+    def raise_if_failed(self):
+        """Raises if a flush has failed; producers call it before doing work whose rows would be dropped."""
+        if self.error is not None:
+            raise RuntimeError(f"{self.name} stopped after a failed flush") from self.error
+
+    def run(self):
+        try:
+            self._write_until_stopped()
+        except Exception as e:
+            # Storing newer rows after a lost batch would move the next run's incremental start
+            # past the lost rows, so the first failure stops all writing.
+            logger.error(f"{self.name} failed, no further rows will be written: {e}")
+            self.error = e
+            # Keep draining so producers blocked on a full queue are released and see the error,
+            # unless the failure was the final flush and close() has already been received
+            while not self._stopped and self.q.get() is not _STOP:
+                pass
+
+    def _write_until_stopped(self):
+        buffer = []
+        last_flush = time.monotonic()
+        with self.db_manager.scoped_session() as session:
+            while True:
+                timeout = max(0.0, self.flush_interval - (time.monotonic() - last_flush))
+                try:
+                    item = self.q.get(timeout=timeout)
+                except queue.Empty:
+                    item = None
+                if item is _STOP:
+                    self._stopped = True
+                    break
+                if item:
+                    buffer.extend(item)
+
+                if len(buffer) >= self.flush_rows or time.monotonic() - last_flush >= self.flush_interval:
+                    self._flush(buffer, session)
+                    buffer = []
+                    last_flush = time.monotonic()
+
+            self._flush(buffer, session)
+
+    def _flush(self, buffer: list[dict], session):
+        if buffer:
+            self.db_manager.bulk_upsert(
+                self.model_class, buffer, self.conflict_cols, session=session, raise_on_error=True
+            )
@@ -1,21 +1,25 @@
 import requests
 import logging
+import orjson
+
+from src.common.http import build_session
 
 logger = logging.getLogger(__name__)
 
 class ApiClient:
-    def __init__(self, list_url, data_url_template):
+    def __init__(self, list_url, data_url_template, pool_size: int = 32):
         self.list_url = list_url
         self.data_url_template = data_url_template
-        self.session = requests.Session()
+        # Size the connection pool so concurrent history fetches can all keep a connection alive.
+        self.session = build_session(pool_size=pool_size)
 
     def get_all_funds(self) -> list[dict] | None:
         try:
             response = self.session.get(self.list_url, timeout=30)
             response.raise_for_status()
             logger.info(f"Successfully fetched list of all funds from {self.list_url}")
-            return response.json()
-        except requests.exceptions.RequestException as e:
+            return orjson.loads(response.content)
+        except (requests.exceptions.RequestException, orjson.JSONDecodeError) as e:
             logger.error(f"Failed to fetch all funds: {e}")
             return None
 
@@ -24,10 +28,10 @@ class ApiClient:
         try:
             response = self.session.get(url, timeout=30)
             response.raise_for_status()
-            if not response.text:
+            if not response.content:
                 logger.warning(f"Received empty response for scheme_code {scheme_code}")
                 return None
-            return response.json()
-        except requests.exceptions.RequestException as e:
+            return orjson.loads(response.content)
+        except (requests.exceptions.RequestException, orjson.JSONDecodeError) as e:
             logger.error(f"Failed to fetch history for scheme_code {scheme_code}: {e}")
             return None
@@ -1,18 +1,23 @@
 import configparser
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 from sqlalchemy import select
 import os
 from dotenv import load_dotenv
 
 from src.common.logger import setup_logger
-from src.database.manager import DatabaseManager
-from src.database.models import Security
+from src.database.manager import DatabaseManager, pool_settings_from_config
+from src.database.models import Security, DailyPriceHistory
+from src.database.writer import WriterThread
 from src.mf_dataload.api_client import ApiClient
-from src.mf_dataload.processor import sync_mf_master_list, fetch_and_update_mf_history
+from src.mf_dataload.processor import sync_mf_master_list, fetch_mf_history_records
 
 # Load environment variables from .env file so os.path.expandvars can find them
 load_dotenv()
 
+# Number of fund histories downloaded concurrently; the loader is bound by HTTP latency, not CPU.
+MAX_CONCURRENT_FETCHES = 32
+
 def run_mf_dataload():
     # --- Setup ---
     current_file_path = Path(__file__).resolve()
@@ -49,8 +54,12 @@ def run_mf_dataload():
     logger.info("--- Starting MF Dataload Process ---")
 
     # --- Initialization ---
-    db_manager = DatabaseManager(db_connection_string)
-    api_client = ApiClient(config['API']['list_all_funds_url'], config['API']['fund_data_url_template'])
+    db_manager = DatabaseManager(
+        db_connection_string, **pool_settings_from_config(config['DATABASE'])
+    )
+    api_client = ApiClient(
+        config['API']['list_all_funds_url'], config['API']['fund_data_url_template'], pool_size=MAX_CONCURRENT_FETCHES
+    )
     db_manager.create_tables()
 
     # --- Dataload Logic ---
@@ -60,10 +69,28 @@ def run_mf_dataload():
         stmt = select(Security).where(Security.security_type == 'MF', Security.valid_to.is_(None))
         all_mfs = session.execute(stmt).scalars().all()
 
+    # One query for every fund's last stored NAV date instead of one MAX() per fund.
+    last_sync_dates = db_manager.get_last_daily_dates(stmt.with_only_columns(Security.id))
+
     logger.info(f"Found {len(all_mfs)} active MFs to update.")
-    for mf in all_mfs:
-        logger.info(f"Processing history for {mf.symbol}: {mf.name}")
-        fetch_and_update_mf_history(mf, db_manager, api_client)
+    # Worker threads download and parse; a single writer thread coalesces the rows of many
+    # funds into large upserts instead of one small transaction per fund.
+    with WriterThread(db_manager, DailyPriceHistory, ['security_id', 'price_date']) as writer:
+        def fetch(mf):
+            # Skip the download once the writer has failed; its rows could not be stored
+            writer.raise_if_failed()
+            return fetch_mf_history_records(mf, api_client, last_sync_dates.get(mf.id))
+
+        with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_FETCHES) as executor:
+            futures = {executor.submit(fetch, mf): mf for mf in all_mfs}
+            for future in as_completed(futures):
+                mf = futures[future]
+                logger.info(f"Processing history for {mf.symbol}: {mf.name}")
+                try:
+                    writer.put(future.result())
+                except Exception:
+                    executor.shutdown(cancel_futures=True)
+                    raise
 
     logger.info("--- MF Dataload Process Finished ---")
 
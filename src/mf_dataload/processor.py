@@ -1,6 +1,7 @@
 import logging
-from datetime import datetime
-from sqlalchemy import select, func
+from datetime import date, datetime
+import pandas as pd
+from sqlalchemy import bindparam, select, func, insert, update
 from src.database.models import Security, DailyPriceHistory
 from src.database.manager import DatabaseManager
 from src.mf_dataload.api_client import ApiClient
@@ -17,52 +18,59 @@ def sync_mf_master_list(db_manager: DatabaseManager, api_client: ApiClient):
         logger.error("Could not fetch MF list from API.")
         return
 
+    # Keyed by scheme code first so a code listed twice by the API yields a single row.
+    api_mf_map = {
+        str(f['schemeCode']): (str(f['schemeCode']), f['schemeName'], f.get('isinGrowth') or f.get('isinDivReinvestment'))
+        for f in api_funds
+    }
+    api_rows = set(api_mf_map.values())
+
     with db_manager.Session() as session:
-        stmt = select(Security).where(Security.security_type == 'MF', Security.valid_to.is_(None))
-        db_mfs_raw = session.execute(stmt).scalars().all()
-        db_mf_map = {mf.symbol: mf for mf in db_mfs_raw}
+        is_active_mf = (Security.security_type == 'MF', Security.valid_to.is_(None))
+        stmt = select(Security.symbol, Security.name, Security.isin).where(*is_active_mf)
+        db_rows = {tuple(row) for row in session.execute(stmt)}
 
-        api_mf_map = {str(f['schemeCode']): f for f in api_funds}
-        
-        db_symbols = set(db_mf_map.keys())
+        db_names = {symbol: name for symbol, name, _ in db_rows}
         api_symbols = set(api_mf_map.keys())
 
-        new_symbols = api_symbols - db_symbols
-        deactivated_symbols = db_symbols - api_symbols
-        existing_symbols = db_symbols.intersection(api_symbols)
+        # (symbol, name, isin) tuples missing from the DB are new funds, renamed funds or ISIN changes.
+        changed_rows = api_rows - db_rows
+        new_rows = [row for row in changed_rows if row[0] not in db_names]
+        # Only a name change starts a new version; an ISIN-only change is corrected in place.
+        renamed_rows = [row for row in changed_rows if row[0] in db_names and row[1] != db_names[row[0]]]
+        reisined_rows = [row for row in changed_rows if row[0] in db_names and row[1] == db_names[row[0]]]
+        deactivated_symbols = db_names.keys() - api_symbols
         now = datetime.utcnow()
 
-        for symbol in new_symbols:
-            fund_details = api_mf_map[symbol]
-            new_sec = Security(
-                symbol=symbol,
-                name=fund_details['schemeName'],
-                security_type='MF',
-                exchange='AMFI',
-                isin=fund_details.get('isinGrowth') or fund_details.get('isinDivReinvestment'),
-                valid_from=now
+        # Core statements on the table skip ORM bulk handling; the shared column values,
+        # including the single `now`, are set once on the statement rather than on every row.
+        securities = Security.__table__
+        symbols_to_close = deactivated_symbols | {symbol for symbol, _, _ in renamed_rows}
+        if symbols_to_close:
+            session.execute(
+                update(securities)
+                .where(securities.c.symbol.in_(list(symbols_to_close)), *is_active_mf)
+                .values(valid_to=now)
+            )
+        if reisined_rows:
+            session.execute(
+                update(securities)
+                .where(securities.c.symbol == bindparam('b_symbol'), *is_active_mf)
+                .values(isin=bindparam('b_isin')),
+                [{'b_symbol': symbol, 'b_isin': isin} for symbol, _, isin in reisined_rows],
+            )
+        rows_to_insert = new_rows + renamed_rows
+        if rows_to_insert:
+            session.execute(
+                insert(securities).values(security_type='MF', exchange='AMFI', valid_from=now),
+                [{'symbol': symbol, 'name': name, 'isin': isin} for symbol, name, isin in rows_to_insert],
             )
-            session.add(new_sec)
-        if new_symbols: logger.info(f"Added {len(new_symbols)} new MFs to securities table.")
 
-        for symbol in deactivated_symbols:
-            mf_to_deactivate = db_mf_map[symbol]
-            mf_to_deactivate.valid_to = now
+        if new_rows: logger.info(f"Added {len(new_rows)} new MFs to securities table.")
         if deactivated_symbols: logger.info(f"Deactivated {len(deactivated_symbols)} MFs.")
+        if renamed_rows: logger.info(f"Updated details for {len(renamed_rows)} MFs.")
+        if reisined_rows: logger.info(f"Updated ISIN for {len(reisined_rows)} MFs.")
 
-        for symbol in existing_symbols:
-            db_mf = db_mf_map[symbol]
-            api_mf = api_mf_map[symbol]
-            if db_mf.name != api_mf['schemeName']:
-                db_mf.valid_to = now
-                new_version = Security(
-                    symbol=symbol, name=api_mf['schemeName'], security_type='MF',
-                    exchange='AMFI', isin=api_mf.get('isinGrowth') or api_mf.get('isinDivReinvestment'),
-                    valid_from=now
-                )
-                session.add(new_version)
-                logger.info(f"Updated details for MF {symbol}.")
-        
         session.commit()
 
 def fetch_and_update_mf_history(security: Security, db_manager: DatabaseManager, api_client: ApiClient):
@@ -71,22 +79,49 @@ def fetch_and_update_mf_history(security: Security, db_manager: DatabaseManager,
         stmt = select(func.max(DailyPriceHistory.price_date)).where(DailyPriceHistory.security_id == security.id)
         last_sync_date = session.execute(stmt).scalar_one_or_none()
 
+    records_to_insert = fetch_mf_history_records(security, api_client, last_sync_date)
+    # uq_daily_price makes re-runs idempotent; the date filter only trims the payload.
+    if records_to_insert:
+        db_manager.bulk_upsert(DailyPriceHistory, records_to_insert, ['security_id', 'price_date'])
+
+def fetch_mf_history_records(security: Security, api_client: ApiClient, last_sync_date: date | None) -> list[dict]:
+    """Downloads a fund's NAV history and returns the DailyPriceHistory rows newer than last_sync_date."""
     fund_history = api_client.get_fund_history(int(security.symbol))
     if not fund_history or 'data' not in fund_history:
-        return
+        return []
 
-    records_to_insert = []
-    for nav_entry in fund_history['data']:
-        try:
-            nav_date = datetime.strptime(nav_entry['date'], '%d-%m-%Y').date()
-            if last_sync_date is None or nav_date > last_sync_date:
-                records_to_insert.append({
-                    'security_id': security.id,
-                    'price_date': nav_date,
-                    'close': float(nav_entry['nav']),
-                })
-        except (ValueError, TypeError) as e:
-            logger.warning(f"Could not parse NAV entry for {security.symbol}: {nav_entry}. Error: {e}")
-    
-    if records_to_insert:
-        db_manager.bulk_insert(DailyPriceHistory, records_to_insert)
\ No newline at end of file
+    nav_entries = fund_history['data']
+    if not nav_entries:
+        return []
+
+    # AMFI lists NAVs newest-first; checking both ends keeps this correct for either order.
+    # When neither end is newer than the last sync the fund has nothing new to parse.
+    if last_sync_date is not None:
+        edge_dates = [_parse_nav_date(nav_entries[0]), _parse_nav_date(nav_entries[-1])]
+        if all(d is not None and d <= last_sync_date for d in edge_dates):
+            return []
+
+    # Parse all dates and NAVs in one vectorized pass; unparseable entries become NaT/NaN.
+    navs = pd.DataFrame({
+        'price_date': pd.to_datetime([e.get('date') for e in nav_entries], format='%d-%m-%Y', errors='coerce'),
+        'close': pd.to_numeric([e.get('nav') for e in nav_entries], errors='coerce'),
+    })
+    # Rows dated on or before the last sync were handled (and warned about) by an earlier run;
+    # rows with an unparseable date are kept so they are still reported.
+    if last_sync_date is not None:
+        navs = navs[~(navs['price_date'] <= pd.Timestamp(last_sync_date))]
+    invalid = navs.isna().any(axis=1)
+    for idx in invalid[invalid].index:
+        logger.warning(f"Could not parse NAV entry for {security.symbol}: {nav_entries[idx]}")
+    navs = navs[~invalid]
+
+    return [
+        {'security_id': security.id, 'price_date': nav_date, 'close': close}
+        for nav_date, close in zip(navs['price_date'].dt.date, navs['close'].tolist())
+    ]
+
+def _parse_nav_date(nav_entry: dict) -> date | None:
+    try:
+        return datetime.strptime(nav_entry['date'], '%d-%m-%Y').date()
+    except (KeyError, ValueError, TypeError):
+        return None
\ No newline at end of file
@@ -1,41 +1,184 @@
+import hashlib
 import logging
+import random
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+import orjson
 import requests
 from fyers_apiv3 import fyersModel
 
+from src.common.http import RETRY_STATUSES, build_session
+from src.common.rate_limit import RateLimiter
+
 
 logger = logging.getLogger(__name__)
 
+# Packed layout of one Fyers candle: [epoch, open, high, low, close, volume].
+CANDLE_DTYPE = np.dtype(
+    [
+        ("ts", "i8"),
+        ("open", "f8"),
+        ("high", "f8"),
+        ("low", "f8"),
+        ("close", "f8"),
+        ("volume", "i8"),
+    ]
+)
+
+# A successful get_profile() is remembered here so short-lived runs can skip the round-trip.
+PROFILE_CACHE_PATH = Path.home() / ".cache" / "fyers" / "profile.json"
+PROFILE_CACHE_TTL_SECONDS = 300
+
+# Downloaded master files are kept here with their ETag so unchanged files are revalidated, not re-downloaded.
+MASTER_CACHE_DIR = Path.home() / ".cache" / "fyers" / "master"
+# Returned by download_json_file(skip_unchanged=True) when the file matches the cached copy.
+MASTER_FILE_UNCHANGED = object()
+
+# REST endpoint behind fyersModel.history(); called directly so one pooled session serves every chunk.
+FYERS_HISTORY_URL = "https://api-t1.fyers.in/data/history"
+
+# Fyers allows 10 data API requests per second; rate-limited calls are retried with backoff.
+HISTORY_REQUESTS_PER_SECOND = 10
+HISTORY_MAX_ATTEMPTS = 5
+# Upper bound on history requests open against Fyers at once, however many fetchers share the client.
+HISTORY_MAX_IN_FLIGHT = 8
+
 
 class StockApiClient:
     """
     Client for downloading public, non-authenticated files like symbol masters.
-    (This class is correct and remains unchanged).
+    Payloads are parsed straight from the response bytes with orjson.
     """
 
-    def __init__(self):
-        self.session = requests.Session()
+    def __init__(self, cache_dir: Path | None = MASTER_CACHE_DIR):
+        """Pass cache_dir=None to always download the full file."""
+        self.session = build_session()
+        self.session.headers["Accept-Encoding"] = "gzip, deflate"
+        self.cache_dir = cache_dir
+        # Downloads not yet cached, keyed by URL: (body, ETag)
+        self._pending = {}
         logger.info("StockApiClient for public files initialized.")
 
-    def download_json_file(self, url: str) -> dict | None:
-        """Downloads and parses a JSON file from a public URL."""
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        self.session.close()
+
+    def download_json_file(self, url: str, skip_unchanged: bool = False) -> dict | object | None:
+        """
+        Downloads and parses a JSON file from a public URL. Returns None on any failure.
+        When a cached copy exists it is revalidated with If-None-Match and reused on a 304.
+        A new download only replaces the cached copy once commit_cache(url) is called.
+        With skip_unchanged=True, a file that is the same as the cached copy (a 304, or a 200
+        whose body matches byte for byte, e.g. after a weak ETag miss) is not parsed at all
+        and MASTER_FILE_UNCHANGED is returned instead.
+        """
+        body_path, etag_path = self._cache_paths(url)
+        headers = {}
+        if body_path and body_path.exists() and etag_path.exists():
+            headers["If-None-Match"] = etag_path.read_text()
         try:
-            response = self.session.get(url, timeout=60)
+            response = self.session.get(url, headers=headers, timeout=60)
+            if response.status_code == 304:
+                logger.info(f"Master file unchanged, using cached copy of {url}.")
+                if skip_unchanged:
+                    return MASTER_FILE_UNCHANGED
+                return orjson.loads(body_path.read_bytes())
             response.raise_for_status()
-            return response.json()
-        except requests.exceptions.RequestException as e:
+            if skip_unchanged and body_path and body_path.exists() and body_path.read_bytes() == response.content:
+                logger.info(f"Master file {url} matches the cached copy.")
+                if response.headers.get("ETag"):
+                    etag_path.write_text(response.headers["ETag"])
+                return MASTER_FILE_UNCHANGED
+            data = orjson.loads(response.content)
+        except (requests.exceptions.RequestException, orjson.JSONDecodeError, OSError) as e:
             logger.error(f"Failed to download file from {url}: {e}")
             return None
 
+        if body_path:
+            # Only cached once the caller has stored the data, see commit_cache()
+            self._pending[url] = (response.content, response.headers.get("ETag"))
+        return data
+
+    def commit_cache(self, url: str):
+        """
+        Caches the body and ETag of the last download of url. Call it once the file has been
+        loaded, so a run that dies before its commit never leaves the file looking synced.
+        """
+        body_path, etag_path = self._cache_paths(url)
+        pending = self._pending.pop(url, None)
+        if body_path is None or pending is None:
+            return
+        content, etag = pending
+        try:
+            body_path.parent.mkdir(parents=True, exist_ok=True)
+            body_path.write_bytes(content)
+            if etag:
+                etag_path.write_text(etag)
+            else:
+                etag_path.unlink(missing_ok=True)
+        except OSError as e:
+            logger.warning(f"Could not cache master file {url} at {body_path}: {e}")
+
+    def forget(self, url: str):
+        """Drops the cached copy of url, so the next download is treated as changed."""
+        self._pending.pop(url, None)
+        for path in self._cache_paths(url):
+            if path:
+                path.unlink(missing_ok=True)
+
+    def _cache_paths(self, url: str) -> tuple[Path | None, Path | None]:
+        if self.cache_dir is None:
+            return None, None
+        key = hashlib.sha1(url.encode()).hexdigest()
+        return self.cache_dir / f"{key}.json", self.cache_dir / f"{key}.etag"
+
 
 class FyersApiClient:
     """
-    A client for the Fyers v3 API, using the fyersModel pattern.
+    A client for the Fyers v3 API, using the fyersModel pattern. History requests go to the
+    REST endpoint through a pooled keep-alive session instead of the SDK.
     """
 
-    def __init__(self, client_id: str, access_token: str, log_path: str = "logs/"):
+    def __init__(
+        self,
+        client_id: str,
+        access_token: str,
+        log_path: str = "logs/",
+        verify_connection: bool = False,
+        rate_limiter: RateLimiter | None = None,
+        max_in_flight: int = HISTORY_MAX_IN_FLIGHT,
+    ):
+        """
+        The get_profile() health check only runs when verify_connection is set or when no
+        successful check for this client_id was cached within PROFILE_CACHE_TTL_SECONDS.
+        History calls share rate_limiter, which defaults to HISTORY_REQUESTS_PER_SECOND, and
+        at most max_in_flight of them are open at any time.
+        """
         if not all([client_id, access_token]):
             raise ValueError("Fyers client_id and access_token are required.")
 
+        self.client_id = client_id
+        self.rate_limiter = rate_limiter or RateLimiter(HISTORY_REQUESTS_PER_SECOND)
+        self.in_flight = threading.BoundedSemaphore(max_in_flight)
+        # Keep-alive pool shared by all history calls, sized so every in-flight request gets a connection.
+        # 429s are never retried by the session, Retry-After or not; fetch_history_chunk backs off
+        # on them through the rate limiter instead of sleeping while holding an in-flight slot.
+        self.session = build_session(
+            pool_size=max_in_flight,
+            status_forcelist=tuple(s for s in RETRY_STATUSES if s != 429),
+            respect_retry_after_header=False,
+        )
+        self.session.headers.update(
+            {"Authorization": f"{client_id}:{access_token}", "Accept-Encoding": "gzip, deflate"}
+        )
         try:
             self.fyers = fyersModel.FyersModel(
                 client_id=client_id,
@@ -46,23 +189,51 @@ class FyersApiClient:
 
             logger.info("FyersApiClient initialized with fyersModel.")
 
-            response = self.fyers.get_profile()
-            if response.get("s") != "ok":
-                raise ConnectionError(
-                    f"Failed to connect to Fyers API: {response.get('message')}"
-                )
-            logger.info(
-                f"Successfully connected to Fyers API. Welcome, {response['data']['name']}."
-            )
+            cached_name = None if verify_connection else self._read_cached_profile_name()
+            if cached_name is not None:
+                logger.info(f"Using cached Fyers profile. Welcome, {cached_name}.")
+            else:
+                self._verify_connection()
 
         except Exception as e:
             logger.error(f"Failed to initialize FyersApiClient: {e}")
             raise
 
+    def _verify_connection(self):
+        response = self.fyers.get_profile()
+        if response.get("s") != "ok":
+            raise ConnectionError(
+                f"Failed to connect to Fyers API: {response.get('message')}"
+            )
+        name = response["data"]["name"]
+        logger.info(f"Successfully connected to Fyers API. Welcome, {name}.")
+        try:
+            PROFILE_CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+            PROFILE_CACHE_PATH.write_bytes(
+                orjson.dumps({"client_id": self.client_id, "name": name, "checked_at": time.time()})
+            )
+        except OSError as e:
+            logger.warning(f"Could not cache Fyers profile at {PROFILE_CACHE_PATH}: {e}")
+
+    def _read_cached_profile_name(self) -> str | None:
+        try:
+            cached = orjson.loads(PROFILE_CACHE_PATH.read_bytes())
+        except (OSError, orjson.JSONDecodeError):
+            return None
+        if cached.get("client_id") != self.client_id:
+            return None
+        if time.time() - cached.get("checked_at", 0) > PROFILE_CACHE_TTL_SECONDS:
+            return None
+        return cached.get("name")
+
     def fetch_history_chunk(
         self, symbol: str, resolution: str, range_from: str, range_to: str
-    ) -> list | None:
-        """A single, direct call to the Fyers history API for one chunk of data."""
+    ) -> np.ndarray | None:
+        """
+        A single, direct call to the Fyers history API for one chunk of data.
+        Candles are returned as a CANDLE_DTYPE structured array, empty when the range has no
+        data; None means the request or the API call failed.
+        """
         data = {
             "symbol": symbol,
             "resolution": resolution,
@@ -72,9 +243,24 @@ class FyersApiClient:
             "cont_flag": "1",
         }
         try:
-            response = self.fyers.history(data=data)
+            for attempt in range(1, HISTORY_MAX_ATTEMPTS + 1):
+                with self.in_flight, self.rate_limiter:
+                    response = self._request_history(data)
+                if not self._is_rate_limited(response) or attempt == HISTORY_MAX_ATTEMPTS:
+                    break
+                backoff = min(60, 2 ** attempt) * random.uniform(0.5, 1.0)
+                logger.warning(
+                    f"Rate limited fetching {symbol} ({resolution}), retrying in {backoff:.1f}s "
+                    f"(attempt {attempt}/{HISTORY_MAX_ATTEMPTS})."
+                )
+                self.rate_limiter.pause(backoff)
+
+            if response.get("s") == "no_data":
+                # Fyers' reply for a range with no candles, e.g. before listing or over a holiday
+                return np.empty(0, dtype=CANDLE_DTYPE)
             if response.get("s") == "ok":
-                return response.get("candles", [])
+                candles = response.get("candles") or []
+                return np.array([tuple(c) for c in candles], dtype=CANDLE_DTYPE)
             else:
                 logger.error(
                     f"API Error for {symbol} ({resolution}): {response.get('message')}"
@@ -83,3 +269,14 @@ class FyersApiClient:
         except Exception as e:
             logger.error(f"Exception during history fetch for {symbol}: {e}")
             return None
+
+    def _request_history(self, data: dict) -> dict:
+        """Same request and JSON reply as fyersModel.history(), over the client's pooled session."""
+        response = self.session.get(FYERS_HISTORY_URL, params=data, timeout=30)
+        if response.status_code == 429:
+            return {"s": "error", "code": 429, "message": "HTTP 429: request limit reached"}
+        return orjson.loads(response.content)
+
+    @staticmethod
+    def _is_rate_limited(response: dict) -> bool:
+        return response.get("code") == 429 or "request limit" in str(response.get("message", "")).lower()
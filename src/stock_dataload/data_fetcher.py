@@ -1,54 +1,86 @@
 import logging
-import time
-from datetime import datetime, date, timedelta
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, date
 
-from src.stock_dataload.api_client import FyersApiClient
+from src.stock_dataload.api_client import CANDLE_DTYPE, FyersApiClient
 
 logger = logging.getLogger(__name__)
 
+# Width of one history request window per resolution; every intraday resolution uses 60 days.
+DAYS_PER_CHUNK = {"D": 365 * 2}
+DEFAULT_DAYS_PER_CHUNK = 60
+SECONDS_PER_DAY = 24 * 60 * 60
+
 
 class HistoricalDataFetcher:
-    def __init__(self, fyers_client: FyersApiClient):
+    def __init__(self, fyers_client: FyersApiClient, max_concurrent_chunks: int = 4):
         self.fyers_client = fyers_client
+        self.max_concurrent_chunks = max_concurrent_chunks
         logger.info("HistoricalDataFetcher initialized.")
 
-    def get_history(self, symbol: str, timeframe: str, start_date: date, end_date: date) -> list:
+    def get_history(self, symbol: str, timeframe: str, start_date: date, end_date: date) -> np.ndarray:
         """
         The main public method. Fetches complete historical data for a given range,
         handling chunking and backward iteration automatically using epoch timestamps.
+        Chunks are requested in concurrent waves of max_concurrent_chunks, newest first,
+        and fetching stops at the first chunk that comes back empty. Pacing is left to the
+        client's rate limiter. Raises ConnectionError if any chunk request fails, so a
+        partial history is never returned.
+        Returns a CANDLE_DTYPE structured array sorted by timestamp.
         """
-        all_candles = []
-        days_per_chunk = 365 * 2 if timeframe == "D" else 60
+        chunks = []
+        seconds_per_chunk = DAYS_PER_CHUNK.get(timeframe, DEFAULT_DAYS_PER_CHUNK) * SECONDS_PER_DAY
 
-        # Convert dates to epoch for processing
-        start_epoch = int(datetime.combine(start_date, time.min).timestamp())
-        end_epoch = int(datetime.combine(end_date, time.max).timestamp())
+        # Convert dates to epoch for processing; intraday callers may pass a datetime start
+        if not isinstance(start_date, datetime):
+            start_date = datetime.combine(start_date, datetime.min.time())
+        start_epoch = int(start_date.timestamp())
+        end_epoch = int(datetime.combine(end_date, datetime.max.time()).timestamp())
 
+        # Build every (from, to) window up front, walking backwards from the end date
+        windows = []
         current_to_epoch = end_epoch
         while current_to_epoch > start_epoch:
-            chunk_from_epoch = current_to_epoch - (days_per_chunk * 24 * 60 * 60)
-            if chunk_from_epoch < start_epoch:
-                chunk_from_epoch = start_epoch
-
-            if chunk_from_epoch >= current_to_epoch: break
+            chunk_from_epoch = max(current_to_epoch - seconds_per_chunk, start_epoch)
+            windows.append((chunk_from_epoch, current_to_epoch))
+            current_to_epoch = chunk_from_epoch
 
-            logger.info(
-                f"Fetching chunk for {symbol} ({timeframe}) from {datetime.fromtimestamp(chunk_from_epoch).date()} to {datetime.fromtimestamp(current_to_epoch).date()}")
+        def fetch(window):
+            chunk_from_epoch, chunk_to_epoch = window
+            if logger.isEnabledFor(logging.INFO):
+                logger.info(
+                    "Fetching chunk for %s (%s) from %s to %s", symbol, timeframe,
+                    date.fromtimestamp(chunk_from_epoch), date.fromtimestamp(chunk_to_epoch))
+            return self.fyers_client.fetch_history_chunk(symbol, timeframe, chunk_from_epoch, chunk_to_epoch)
 
-            chunk_data = self.fyers_client.fetch_history_chunk(
-                symbol, timeframe, chunk_from_epoch, current_to_epoch
-            )
+        with ThreadPoolExecutor(max_workers=self.max_concurrent_chunks) as executor:
+            for wave_start in range(0, len(windows), self.max_concurrent_chunks):
+                wave = windows[wave_start : wave_start + self.max_concurrent_chunks]
+                exhausted = False
+                for (_, chunk_to_epoch), chunk_data in zip(wave, executor.map(fetch, wave)):
+                    if chunk_data is None:
+                        # A failed request is not the end of the data; storing what was fetched
+                        # so far would leave a gap the next incremental run never revisits.
+                        raise ConnectionError(
+                            f"History request for {symbol} ({timeframe}) ending "
+                            f"{date.fromtimestamp(chunk_to_epoch)} failed."
+                        )
+                    if len(chunk_data):
+                        chunks.append(chunk_data)
+                    else:
+                        if logger.isEnabledFor(logging.INFO):
+                            logger.info("No more data found for %s before %s.", symbol, date.fromtimestamp(chunk_to_epoch))
+                        exhausted = True
+                        break
 
-            if chunk_data:
-                all_candles.extend(chunk_data)
-            else:
-                logger.info(
-                    f"No more data found for {symbol} before {datetime.fromtimestamp(current_to_epoch).date()}.")
-                break
+                if exhausted:
+                    break
 
-            current_to_epoch = chunk_from_epoch
-            time.sleep(0.5)
+        if not chunks:
+            return np.empty(0, dtype=CANDLE_DTYPE)
 
         # Ensure uniqueness and sort chronologically
-        unique_candles = {candle[0]: candle for candle in all_candles}
-        return sorted(list(unique_candles.values()), key=lambda x: x[0])
\ No newline at end of file
+        all_candles = np.concatenate(chunks)
+        _, unique_idx = np.unique(all_candles["ts"], return_index=True)
+        return all_candles[unique_idx]
@@ -1,9 +1,15 @@
 import logging
+from itertools import islice
+from operator import itemgetter
 from datetime import datetime, date, timedelta
 import time
-from sqlalchemy import select
 
-from src.database.manager import DatabaseManager
+import numpy as np
+from sqlalchemy import String, bindparam, insert, select, text
+from sqlalchemy.dialects.postgresql import ARRAY
+
+from src.database.manager import COPY_THRESHOLD, DatabaseManager
+from src.database.writer import WriterThread
 from src.database.models import (
     Security,
     DailyPriceHistory,
@@ -17,196 +23,352 @@ from src.stock_dataload.data_fetcher import HistoricalDataFetcher
 
 logger = logging.getLogger(__name__)
 
+# Anti-join of the master file's symbols against the stored ones, so the diff runs server-side.
+_NEW_SYMBOLS = text(
+    "SELECT t.symbol FROM unnest(:symbols) AS t(symbol) "
+    "WHERE NOT EXISTS (SELECT 1 FROM securities s "
+    "WHERE s.symbol = t.symbol AND s.exchange = :exchange AND s.segment = :segment)"
+).bindparams(bindparam("symbols", type_=ARRAY(String)))
+
+# Exact symbol suffixes, checked before the prefix rules below.
+_SUFFIX_MAP = {
+    "INDEX": "INDEX",
+    "EQ": "EQUITY",
+    "SM": "EQUITY",
+    "ST": "EQUITY",
+    "BZ": "EQUITY",
+    "E1": "EQUITY",
+    "BE": "ETF",
+    "IV": "INVIT",
+    "RE": "REIT",
+    "SG": "SGB",
+    "GB": "SGB",
+    "GS": "GSEC",
+    "RR": "RIGHTS",
+}
+
+# First letter of the suffix, used when there is no exact match.
+_PREFIX_MAP = {
+    "N": "BOND",
+    "Y": "BOND",
+    "Z": "BOND",
+    "M": "BOND",
+    "D": "BOND",
+    "P": "PREFERENCE_SHARE",
+    "W": "WARRANT",
+}
+
+# New master records are built and inserted in batches of this size.
+MASTER_BATCH_SIZE = 10_000
+
+# Spacing of the UTC-offset probes in _local_times; shorter than any DST period.
+OFFSET_PROBE_SECONDS = 7 * 24 * 60 * 60
+
+
+def _classify_security(symbol: str, isin: str | None) -> str:
+    """
+    Classifies a security type based on its symbol suffix or ISIN.
+    This is the complete version with all rules.
+    """
+    if isin and isin.startswith("INF"):
+        return "MF"
+
+    dash = symbol.rfind("-")
+    suffix = symbol[dash + 1 :] if dash >= 0 else ""
+    return _SUFFIX_MAP.get(suffix) or _PREFIX_MAP.get(suffix[:1], "UNKNOWN")
+
 
 class SymbolMasterLoader:
     def __init__(self, db_manager: DatabaseManager):
         self.db_manager = db_manager
         logger.info("SymbolMasterLoader initialized.")
 
-    def _classify_security(self, symbol: str, isin: str | None) -> str:
+    def has_securities(self, exchange: str, segment: str) -> bool:
+        """True when at least one security of exchange:segment is already stored."""
+        with self.db_manager.BulkSession() as session:
+            stmt = select(Security.id).where(Security.exchange == exchange, Security.segment == segment).limit(1)
+            return session.execute(stmt).first() is not None
+
+    def _store_new_records(self, session, build_batch, meta_model, items: list[tuple[str, dict]], exchange: str, segment: str):
         """
-        Classifies a security type based on its symbol suffix or ISIN.
-        This is the complete version with all rules.
+        Builds rows for the new master records MASTER_BATCH_SIZE records at a time and inserts
+        each batch before building the next, so only one batch of row dicts is alive at once.
+        Everything runs in the caller's transaction.
         """
-        if isin and isin.startswith("INF"):
-            return "MF"
-
-        parts = symbol.split("-")
-        suffix = parts[-1] if len(parts) > 1 else ""
-
-        if suffix == "INDEX":
-            return "INDEX"
-        if suffix in ("EQ", "SM", "ST", "BZ", "E1"):
-            return "EQUITY"
-        if suffix == "BE":
-            return "ETF"
-        if suffix == "IV":
-            return "INVIT"
-        if suffix == "RE":
-            return "REIT"
-        if suffix in ("SG", "GB"):
-            return "SGB"
-        if suffix == "GS":
-            return "GSEC"
-        if suffix.startswith(("N", "Y", "Z", "M", "D")):
-            return "BOND"
-        if suffix.startswith("P"):
-            return "PREFERENCE_SHARE"
-        if suffix == "RR":
-            return "RIGHTS"
-        if suffix.startswith("W"):
-            return "WARRANT"
-        if suffix == "MF":
-            return "MF"
-
-        return "UNKNOWN"
+        valid_from = datetime.utcnow()
+        for i in range(0, len(items), MASTER_BATCH_SIZE):
+            sec_rows, meta_rows, skipped = build_batch(items[i : i + MASTER_BATCH_SIZE], exchange, segment, valid_from)
+            for symbol in skipped:
+                logger.error("Could not parse expiryDate for %s. Skipping.", symbol)
+            new_ids = self._insert_securities(session, sec_rows)
+            self._insert_meta(session, meta_model, meta_rows, new_ids)
+
+    def _new_symbols(self, session, symbols: list[str], exchange: str, segment: str) -> list[str]:
+        """Returns the symbols not yet stored for exchange/segment, diffed inside PostgreSQL when possible."""
+        if self.db_manager.engine.dialect.name == "postgresql":
+            params = {"symbols": symbols, "exchange": exchange, "segment": segment}
+            return session.execute(_NEW_SYMBOLS, params).scalars().all()
+
+        stmt = select(Security.symbol).where(
+            Security.exchange == exchange, Security.segment == segment
+        )
+        db_symbols_set = set(session.scalars(stmt.execution_options(yield_per=2000)))
+        return [s for s in symbols if s not in db_symbols_set]
+
+    def _insert_securities(self, session, sec_rows: list[dict]) -> dict[str, int]:
+        """
+        Inserts the securities and returns the new ids keyed by symbol; symbols that already
+        exist are skipped and left out of the result. Large batches on PostgreSQL go through
+        COPY into a staging table; otherwise one executemany is used.
+        """
+        if not sec_rows:
+            return {}
+        if len(sec_rows) > COPY_THRESHOLD and self.db_manager.supports_copy():
+            rows = self.db_manager.staged_copy_insert(
+                session, Security, sec_rows, ["symbol"], [Security.symbol, Security.id]
+            )
+            return dict(rows)
+        stmt = self.db_manager.insert_ignoring_conflicts(Security, ["symbol"])
+        result = session.execute(stmt.returning(Security.symbol, Security.id), sec_rows)
+        return dict(result.tuples().all())
+
+    def _insert_meta(self, session, model_class, meta_rows: dict[str, dict], new_ids: dict[str, int]):
+        """Inserts the metadata rows of the securities that were just created, in the same transaction."""
+        rows = [{**meta, "security_id": new_ids[symbol]} for symbol, meta in meta_rows.items() if symbol in new_ids]
+        if not rows:
+            return
+        if len(rows) > COPY_THRESHOLD and self.db_manager.supports_copy():
+            self.db_manager.copy_rows(session, model_class.__tablename__, rows)
+        else:
+            session.execute(insert(model_class), rows)
 
     def process_capital_market_master(self, data: dict, exchange: str, segment: str):
         logger.info(f"Processing {len(data)} symbols for {exchange}:{segment}...")
-        with self.db_manager.Session() as session:
-            stmt = select(Security.symbol).where(
-                Security.exchange == exchange, Security.segment == segment
-            )
-            db_symbols_set = set(session.execute(stmt).scalars().all())
-            new_records = {s: i for s, i in data.items() if s not in db_symbols_set}
+        with self.db_manager.BulkSession() as session:
+            new_records = [
+                (s, data[s]) for s in self._new_symbols(session, list(data), exchange, segment)
+            ]
 
             if not new_records:
                 logger.info("No new CM symbols to add.")
                 return
 
             logger.info(f"Identified {len(new_records)} new CM instruments.")
-            for symbol, item in new_records.items():
-                isin = item.get("isin") or None
-                sec_type = self._classify_security(symbol, isin)
-                if sec_type in ("MF", "UNKNOWN"):
-                    continue
-
-                new_sec = Security(
-                    symbol=symbol,
-                    name=item["symbolDetails"],
-                    security_type=sec_type,
-                    exchange=exchange,
-                    segment=segment,
-                    isin=isin,
-                    valid_from=datetime.utcnow(),
-                )
-                session.add(new_sec)
-                if sec_type == "EQUITY":
-                    session.flush()
-                    session.add(
-                        SecuritiesEquityMeta(
-                            security_id=new_sec.id,
-                            lot_size=item["minLotSize"],
-                            tick_size=item["tickSize"],
-                            company_name=item["symbolDetails"],
-                        )
-                    )
+            self._store_new_records(session, _build_cm_rows, SecuritiesEquityMeta, new_records, exchange, segment)
             session.commit()
 
     def process_derivative_master(self, data: dict, exchange: str, segment: str):
         logger.info(
             f"Processing {len(data)} derivative symbols for {exchange}:{segment}..."
         )
-        with self.db_manager.Session() as session:
-            stmt = select(Security.symbol).where(
-                Security.exchange == exchange, Security.segment == segment
-            )
-            db_symbols_set = set(session.execute(stmt).scalars().all())
-            new_records = {s: i for s, i in data.items() if s not in db_symbols_set}
+        with self.db_manager.BulkSession() as session:
+            new_records = [
+                (s, data[s]) for s in self._new_symbols(session, list(data), exchange, segment)
+            ]
 
             if not new_records:
                 logger.info("No new derivative symbols to add.")
                 return
 
             logger.info(f"Identified {len(new_records)} new derivatives to add.")
-            for symbol, item in new_records.items():
-                opt_type = item.get("optType")
-                sec_type = (
-                    "FUTURE"
-                    if opt_type == "XX"
-                    else "OPTION" if opt_type in ("CE", "PE") else None
-                )
-                if not sec_type:
-                    continue
-
-                new_sec = Security(
-                    symbol=symbol,
-                    name=item["symbolDetails"],
-                    security_type=sec_type,
-                    exchange=exchange,
-                    segment=segment,
-                    isin=(item.get("isin") or None),
-                    valid_from=datetime.utcnow(),
-                )
-
-                try:
-                    expiry = datetime.fromtimestamp(int(item["expiryDate"])).date()
-                except (ValueError, TypeError):
-                    logger.error(f"Could not parse expiryDate for {symbol}. Skipping.")
-                    continue
-
-                deriv_meta = SecuritiesDerivativeMeta(
-                    underlying_symbol=item["underSym"],
-                    instrument_type="FUT" if sec_type == "FUTURE" else "OPT",
-                    expiry_date=expiry,
-                    strike_price=(
-                        item.get("strikePrice") if sec_type == "OPTION" else None
-                    ),
-                    option_type=opt_type if sec_type == "OPTION" else None,
-                    lot_size=item["minLotSize"],
-                    tick_size=item["tickSize"],
-                )
-                new_sec.derivative_meta = deriv_meta
-                session.add(new_sec)
+            self._store_new_records(session, _build_derivative_rows, SecuritiesDerivativeMeta, new_records, exchange, segment)
             session.commit()
 
 
+# Required master-file fields, fetched in one C-level call per record.
+_EQUITY_FIELDS = itemgetter("symbolDetails", "minLotSize", "tickSize")
+_DERIVATIVE_FIELDS = itemgetter("symbolDetails", "minLotSize", "tickSize", "expiryDate", "underSym")
+
+
+def _build_cm_rows(items: list[tuple[str, dict]], exchange: str, segment: str, valid_from: datetime):
+    """Returns (security rows, equity meta rows keyed by symbol, skipped symbols) for capital-market records."""
+    sec_rows, equity_meta_rows = [], {}
+    for symbol, item in items:
+        isin = item.get("isin") or None
+        sec_type = _classify_security(symbol, isin)
+        if sec_type in ("MF", "UNKNOWN"):
+            continue
+
+        sec_rows.append(
+            {
+                "symbol": symbol,
+                "name": item["symbolDetails"],
+                "security_type": sec_type,
+                "exchange": exchange,
+                "segment": segment,
+                "isin": isin,
+                "valid_from": valid_from,
+            }
+        )
+        if sec_type == "EQUITY":
+            name, lot_size, tick_size = _EQUITY_FIELDS(item)
+            equity_meta_rows[symbol] = {
+                "lot_size": lot_size,
+                "tick_size": tick_size,
+                "company_name": name,
+            }
+    return sec_rows, equity_meta_rows, []
+
+
+def _build_derivative_rows(items: list[tuple[str, dict]], exchange: str, segment: str, valid_from: datetime):
+    """Returns (security rows, derivative meta rows keyed by symbol, symbols with a bad expiry) for F&O records."""
+    sec_rows, deriv_meta_rows, skipped = [], {}, []
+    for symbol, item in items:
+        opt_type = item.get("optType")
+        sec_type = (
+            "FUTURE"
+            if opt_type == "XX"
+            else "OPTION" if opt_type in ("CE", "PE") else None
+        )
+        if not sec_type:
+            continue
+
+        name, lot_size, tick_size, expiry_ts, underlying = _DERIVATIVE_FIELDS(item)
+        try:
+            expiry = date.fromtimestamp(int(expiry_ts))
+        except (ValueError, TypeError):
+            skipped.append(symbol)
+            continue
+
+        sec_rows.append(
+            {
+                "symbol": symbol,
+                "name": name,
+                "security_type": sec_type,
+                "exchange": exchange,
+                "segment": segment,
+                "isin": (item.get("isin") or None),
+                "valid_from": valid_from,
+            }
+        )
+        deriv_meta_rows[symbol] = {
+            "underlying_symbol": underlying,
+            "instrument_type": "FUT" if sec_type == "FUTURE" else "OPT",
+            "expiry_date": expiry,
+            "strike_price": (
+                item.get("strikePrice") if sec_type == "OPTION" else None
+            ),
+            "option_type": opt_type if sec_type == "OPTION" else None,
+            "lot_size": lot_size,
+            "tick_size": tick_size,
+        }
+    return sec_rows, deriv_meta_rows, skipped
+
+
 class PriceHistoryLoader:
-    def __init__(self, db_manager: DatabaseManager, data_fetcher: HistoricalDataFetcher):
+    def __init__(
+        self,
+        db_manager: DatabaseManager,
+        data_fetcher: HistoricalDataFetcher,
+        last_daily_dates: dict[int, date] | None = None,
+        daily_writer: WriterThread | None = None,
+        last_intraday_timestamps: dict[int, datetime] | None = None,
+        intraday_writer: WriterThread | None = None,
+    ):
+        """
+        last_daily_dates and last_intraday_timestamps, when given, are the results of
+        DatabaseManager.get_last_daily_dates() / get_last_intraday_timestamps() and replace the
+        per-security max() queries. daily_writer and intraday_writer, when given, receive the
+        rows of their timeframe, so the database writes run on their own thread, overlapping
+        the next API fetches, and are upserted in large batches across securities.
+        """
         self.db_manager = db_manager
         self.data_fetcher = data_fetcher
+        self.last_daily_dates = last_daily_dates
+        self.last_intraday_timestamps = last_intraday_timestamps
+        self.daily_writer = daily_writer
+        self.intraday_writer = intraday_writer
         logger.info("PriceHistoryLoader initialized.")
 
+    def _last_daily_date(self, security_id: int) -> date | None:
+        if self.last_daily_dates is not None:
+            return self.last_daily_dates.get(security_id)
+        last_update = self.db_manager.get_last_daily_update(security_id)
+        return last_update.date() if last_update else None
+
+    def _last_intraday_timestamp(self, security_id: int) -> datetime | None:
+        if self.last_intraday_timestamps is not None:
+            return self.last_intraday_timestamps.get(security_id)
+        return self.db_manager.get_last_intraday_update(security_id)
+
     def load_history_for_security(self, security: Security, timeframe: str):
         """
         Orchestrates the incremental loading of history for a single security.
+        Only security.id and security.symbol are read, so a (id, symbol) row works as well.
         """
-        logger.info(f"Processing '{timeframe}' data for {security.symbol}...")
+        logger.debug("Processing '%s' data for %s...", timeframe, security.symbol)
 
-        # 1. Determine target table and find the last update time
+        # 1. Determine target table and time column, and find the last update time
         if timeframe == "D":
-            target_model = DailyPriceHistory
-            last_update = self.db_manager.get_last_daily_update(security.id)
-            start_date = (last_update + timedelta(days=1)).date() if last_update else date.today() - timedelta(
+            target_model, time_key, time_unit = DailyPriceHistory, 'price_date', 'D'
+            last_update = self._last_daily_date(security.id)
+            start_date = last_update + timedelta(days=1) if last_update else date.today() - timedelta(
                 days=365 * 20)
         elif timeframe == "1":
-            target_model = OneMinuteHistory
-            last_update = self.db_manager.get_last_intraday_update(security.id)
+            target_model, time_key, time_unit = OneMinuteHistory, 'price_timestamp', 's'
+            last_update = self._last_intraday_timestamp(security.id)
             start_date = last_update + timedelta(minutes=1) if last_update else datetime.now() - timedelta(days=365 * 7)
         else:
             return
 
         end_date = datetime.now().date()
-        if start_date > end_date:
-            logger.info(f"Data for {security.symbol} ({timeframe}) is already up to date.")
+        if (start_date.date() if isinstance(start_date, datetime) else start_date) > end_date:
+            logger.debug("Data for %s (%s) is already up to date.", security.symbol, timeframe)
             return
 
-        # 2. Use the fetcher to get all new data
+        # 2. Use the fetcher to get all new data, unless the writer has already given up
+        writer = self.daily_writer if target_model is DailyPriceHistory else self.intraday_writer
+        if writer is not None:
+            writer.raise_if_failed()
         new_data = self.data_fetcher.get_history(security.symbol, timeframe, start_date, end_date)
 
-        if not new_data:
-            logger.info(f"No new '{timeframe}' data found for {security.symbol}.")
+        if len(new_data) == 0:
+            logger.debug("No new '%s' data found for %s.", timeframe, security.symbol)
             return
 
-        # 3. Prepare and store the data
-        records_to_insert = []
-        for candle in new_data:
-            record = {'security_id': security.id, 'open': candle[1], 'high': candle[2], 'low': candle[3],
-                      'close': candle[4], 'volume': candle[5]}
-            if timeframe == "D":
-                record['price_date'] = datetime.fromtimestamp(candle[0]).date()
-            else:
-                record['price_timestamp'] = datetime.fromtimestamp(candle[0])
-            records_to_insert.append(record)
-
-        self.db_manager.bulk_insert(target_model, records_to_insert)
\ No newline at end of file
+        # 3. Prepare and store the data, reading whole columns out of the packed candle array
+        times = _local_times(new_data['ts'], time_unit).tolist()
+
+        columns = {
+            'security_id': [security.id] * len(times),
+            time_key: times,
+            'open': new_data['open'].tolist(),
+            'high': new_data['high'].tolist(),
+            'low': new_data['low'].tolist(),
+            'close': new_data['close'].tolist(),
+            'volume': new_data['volume'].tolist(),
+        }
+
+        if writer is not None:
+            # Hand the rows over one flush-sized batch at a time; put() blocks if the writer is behind
+            records = _iter_records(columns)
+            while batch := list(islice(records, writer.flush_rows)):
+                writer.put(batch)
+        elif len(times) > COPY_THRESHOLD and self.db_manager.supports_copy():
+            # Large intraday backfills go straight from the columns into COPY, with no per-row dicts
+            self.db_manager.copy_columns(target_model, columns)
+        else:
+            # Row dicts are built lazily, one insert batch at a time
+            self.db_manager.bulk_insert_iter(target_model, _iter_records(columns))
+
+
+def _local_times(epochs: np.ndarray, unit: str) -> np.ndarray:
+    """
+    Converts epoch seconds to naive local datetime64 values at `unit` precision ('D' or 's'),
+    matching date/datetime.fromtimestamp. When the UTC offset is the same across the range
+    (sampled every OFFSET_PROBE_SECONDS) it is applied as one vectorised add; ranges that cross
+    a DST change fall back to converting each value.
+    """
+    if len(epochs) == 0:
+        return epochs.astype(f"datetime64[{unit}]")
+    first, last = int(epochs.min()), int(epochs.max())
+    probes = list(range(first, last, OFFSET_PROBE_SECONDS)) + [last]
+    offsets = {time.localtime(t).tm_gmtoff for t in probes}
+    if len(offsets) == 1:
+        return (epochs + offsets.pop()).astype("datetime64[s]").astype(f"datetime64[{unit}]")
+    return np.array([datetime.fromtimestamp(ts) for ts in epochs.tolist()], dtype=f"datetime64[{unit}]")
+
+
+def _iter_records(columns: dict[str, list]):
+    keys = list(columns)
+    return (dict(zip(keys, row)) for row in zip(*columns.values()))
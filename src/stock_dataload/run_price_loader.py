@@ -1,69 +1,125 @@
+import logging
 import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache
+
 from dotenv import load_dotenv
-import configparser
-from pathlib import Path
+from sqlalchemy import select
 
+from src.common.context import PROJECT_ROOT, get_context
 from src.common.logger import setup_logger
 from src.database.manager import DatabaseManager
-from src.database.models import Security
+from src.database.models import DailyPriceHistory, OneMinuteHistory, Security
+from src.database.writer import WriterThread
 from src.stock_dataload.api_client import FyersApiClient
 from src.stock_dataload.processor import PriceHistoryLoader
 from src.stock_dataload.data_fetcher import HistoricalDataFetcher
 
-load_dotenv()
+MAX_CONCURRENT_SECURITIES = 8
+# Intraday batches allowed to queue up for the writer before loaders wait on it.
+MAX_PENDING_INTRADAY_BATCHES = 8
+# Securities fetched per round trip while streaming the active universe.
+SECURITY_FETCH_SIZE = 500
+# Progress is logged once per this many finished (security, timeframe) loads; per-load lines are DEBUG.
+PROGRESS_LOG_EVERY = 50
 
 
-def run_price_history_load():
+def _load_runtime() -> tuple[logging.Logger, DatabaseManager, HistoricalDataFetcher]:
     """
-    Main function to run the daily price history dataload for all relevant securities.
+    Sets up logging and the Fyers fetcher on top of the shared app context, so repeated runs
+    (e.g. from a scheduler loop) reuse the engine's connection pool. The Fyers credentials are
+    re-read from .env on every run, since the access token is replaced daily.
+    Raises if the Fyers client cannot be created.
+    """
+    logger = setup_logger("price_loader", PROJECT_ROOT / "logs/price_history_loader.log")
+    db_manager = get_context().db_manager
+    load_dotenv(override=True)
+    try:
+        data_fetcher = _build_fetcher(os.getenv("FYERS_CLIENT_ID"), os.getenv("FYERS_ACCESS_TOKEN"))
+    except Exception as e:
+        logger.error(f"Initialization failed: {e}")
+        raise
+
+    return logger, db_manager, data_fetcher
+
+
+@lru_cache(maxsize=1)
+def _build_fetcher(client_id: str, access_token: str) -> HistoricalDataFetcher:
+    """
+    Keyed on the credentials, so runs reuse the Fyers session until the token changes and a
+    new token gets a new client. Failures are not cached.
     """
-    project_root = Path(__file__).resolve().parent.parent.parent
-    config = configparser.ConfigParser()
-    config.read(project_root / "config" / "config.ini")
+    return HistoricalDataFetcher(FyersApiClient(client_id=client_id, access_token=access_token))
 
-    log_file_path = project_root / "logs/price_history_loader.log"
-    logger = setup_logger("price_loader", log_file_path)
 
-    db_connection_string = os.path.expandvars(config["DATABASE"]["connection_string"])
+# Active equities, futures and indices: the securities whose prices this loader maintains.
+_ACTIVE_SECURITIES = select(Security.id, Security.symbol).where(
+    Security.security_type.in_(["EQUITY", "FUTURE", "INDEX"]),
+    Security.valid_to.is_(None),
+)
 
-    db_manager = DatabaseManager(db_connection_string)
+
+def iter_securities(session):
+    """
+    Streams the id and symbol of every active equity, future and index in batches of
+    SECURITY_FETCH_SIZE. The session must stay open while the generator is consumed.
+    """
+    yield from session.execute(_ACTIVE_SECURITIES.execution_options(yield_per=SECURITY_FETCH_SIZE))
+
+
+def run_price_history_load():
+    """
+    Main function to run the daily price history dataload for all relevant securities.
+    """
     try:
-        fyers_client = FyersApiClient(
-            client_id=os.getenv("FYERS_CLIENT_ID"),
-            access_token=os.getenv("FYERS_ACCESS_TOKEN"),
-        )
-    except Exception as e:
-        logger.error(f"Initialization failed: {e}")
+        logger, db_manager, data_fetcher = _load_runtime()
+    except Exception:
         return
 
-    data_fetcher = HistoricalDataFetcher(fyers_client)
-    price_loader = PriceHistoryLoader(db_manager, data_fetcher)
-
-    with db_manager.Session() as session:
-        securities_to_load = (
-            session.query(Security)
-            .filter(
-                Security.security_type.in_(["EQUITY", "FUTURE", "INDEX"]),
-                Security.valid_to.is_(None),
-            )
-            .all()
-        )
+    timeframes_to_load = ["D", "1"]
 
-    total_securities = len(securities_to_load)
-    logger.info(f"Found {total_securities} active securities to process.")
+    # One query per table up front instead of a max() round trip per security and timeframe
+    active_ids = _ACTIVE_SECURITIES.with_only_columns(Security.id)
+    last_daily_dates = db_manager.get_last_daily_dates(active_ids)
+    last_intraday_timestamps = db_manager.get_last_intraday_timestamps(active_ids)
 
-    timeframes_to_load = ["D", "1"]
+    # Writes for each table run on their own thread, overlapping the API fetches
+    with WriterThread(db_manager, DailyPriceHistory, ["security_id", "price_date"]) as daily_writer, \
+            WriterThread(
+                db_manager, OneMinuteHistory, ["security_id", "price_timestamp"], max_pending=MAX_PENDING_INTRADAY_BATCHES
+            ) as intraday_writer:
+        price_loader = PriceHistoryLoader(
+            db_manager, data_fetcher, last_daily_dates, daily_writer, last_intraday_timestamps, intraday_writer
+        )
+        # Securities are loaded concurrently; the shared Fyers client's rate limiter and
+        # in-flight cap keep the combined request rate within the API quota.
+        with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_SECURITIES) as executor:
+            # Work is submitted as each batch of securities arrives, so fetching starts
+            # before the whole universe has been read.
+            futures = {}
+            with db_manager.BulkSession() as session:
+                for security in iter_securities(session):
+                    for tf in timeframes_to_load:
+                        futures[executor.submit(price_loader.load_history_for_security, security, tf)] = (security, tf)
+            logger.info(f"Found {len(futures) // len(timeframes_to_load)} active securities to process.")
 
-    for i, security in enumerate(securities_to_load):
-        logger.info(f"--- Processing {i + 1}/{total_securities}: {security.symbol} ---")
-        for tf in timeframes_to_load:
-            try:
-                price_loader.load_history_for_security(security, tf)
-            except Exception as e:
-                logger.error(
-                    f"Critical error processing {security.symbol} for timeframe {tf}: {e}",
-                    exc_info=True,
-                )
+            for done, future in enumerate(as_completed(futures), start=1):
+                security, tf = futures[future]
+                try:
+                    future.result()
+                    logger.debug("Done %s (%s)", security.symbol, tf)
+                except Exception as e:
+                    logger.error(
+                        f"Critical error processing {security.symbol} for timeframe {tf}: {e}",
+                        exc_info=True,
+                    )
+                if daily_writer.error is not None or intraday_writer.error is not None:
+                    # Nothing more can be stored; drop the queued loads instead of downloading them
+                    logger.error("A price writer failed; cancelling the remaining loads.")
+                    executor.shutdown(cancel_futures=True)
+                    break
+                if done % PROGRESS_LOG_EVERY == 0 or done == len(futures):
+                    logger.info(f"--- Done {done}/{len(futures)} ---")
 
     logger.info("--- Price History Dataload Finished ---")
 
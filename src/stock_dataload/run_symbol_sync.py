@@ -1,15 +1,17 @@
-import configparser
-from pathlib import Path
-import os
-from dotenv import load_dotenv
 import logging
+from concurrent.futures import ThreadPoolExecutor
 
+from src.common.context import PROJECT_ROOT, get_context
 from src.common.logger import setup_logger
-from src.database.manager import DatabaseManager
-from src.stock_dataload.api_client import StockApiClient
+from src.stock_dataload.api_client import MASTER_FILE_UNCHANGED, StockApiClient
 from src.stock_dataload.processor import SymbolMasterLoader
 
-load_dotenv()
+# (config key, exchange, segment) of every master file to sync.
+MASTER_FILES = [
+    ("nse_cm", "NSE", "CM"),
+    ("nse_fo", "NSE", "FO"),
+]
+MAX_CONCURRENT_MASTER_FILES = 4
 
 
 def process_master_file(key, exchange, segment, config, api_client, loader):
@@ -20,41 +22,54 @@ def process_master_file(key, exchange, segment, config, api_client, loader):
         return
 
     logger.info(f"--- Processing file for {key} ({exchange}:{segment}) ---")
-    json_data = api_client.download_json_file(url)
-
-    if json_data and isinstance(json_data, dict):
-        if segment == "FO":
-            loader.process_derivative_master(
-                data=json_data, exchange=exchange, segment=segment
-            )
+    # An unchanged file was fully loaded on an earlier run, so there is nothing to diff,
+    # unless the database has since lost that segment (e.g. a freshly created one).
+    json_data = api_client.download_json_file(url, skip_unchanged=True)
+    if json_data is MASTER_FILE_UNCHANGED:
+        if loader.has_securities(exchange, segment):
+            logger.info(f"Master file for {key} is unchanged since the last sync. Skipping.")
+            return
+        json_data = api_client.download_json_file(url)
+
+    try:
+        if json_data and isinstance(json_data, dict):
+            if segment == "FO":
+                loader.process_derivative_master(
+                    data=json_data, exchange=exchange, segment=segment
+                )
+            else:
+                loader.process_capital_market_master(
+                    data=json_data, exchange=exchange, segment=segment
+                )
+            # The load has committed, so the file can now be remembered as synced
+            api_client.commit_cache(url)
         else:
-            loader.process_capital_market_master(
-                data=json_data, exchange=exchange, segment=segment
-            )
-    else:
-        logger.error(f"Failed to get valid dictionary data from {url}")
+            logger.error(f"Failed to get valid dictionary data from {url}")
+            api_client.forget(url)
+    except Exception:
+        # Without a successful load the cached copy must not mark the file as synced
+        api_client.forget(url)
+        raise
 
 
 def run_symbol_master_sync():
-    project_root = Path(__file__).resolve().parent.parent.parent
-    config = configparser.ConfigParser()
-    config.read(project_root / "config" / "config.ini")
-
-    log_file_path = project_root / "logs/stock_dataload.log"
-    logger = setup_logger("stock_dataload", log_file_path)
-
-    conn_str_template = config["DATABASE"]["connection_string"]
-    db_connection_string = os.path.expandvars(conn_str_template)
-
-    db_manager = DatabaseManager(db_connection_string)
-    api_client = StockApiClient()
+    logger = setup_logger("stock_dataload", PROJECT_ROOT / "logs/stock_dataload.log")
+    ctx = get_context()
+    config, db_manager = ctx.config, ctx.db_manager
     db_manager.create_tables()
     symbol_loader = SymbolMasterLoader(db_manager)
 
     logger.info("--- Starting Symbol Master Synchronization ---")
 
-    process_master_file("nse_cm", "NSE", "CM", config, api_client, symbol_loader)
-    process_master_file("nse_fo", "NSE", "FO", config, api_client, symbol_loader)
+    # One client shared by every file; each file's download, parse and load runs on its own
+    # thread and session, so one file's network wait overlaps another's database writes.
+    with StockApiClient() as api_client, ThreadPoolExecutor(max_workers=MAX_CONCURRENT_MASTER_FILES) as executor:
+        futures = [
+            executor.submit(process_master_file, key, exchange, segment, config, api_client, symbol_loader)
+            for key, exchange, segment in MASTER_FILES
+        ]
+        for future in futures:
+            future.result()
 
     logger.info("--- Symbol Master Synchronization Finished ---")
 
@@ -0,0 +1,47 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from sqlalchemy import select
+
+from src.database.manager import DatabaseManager
+from src.database.models import Security
+from src.mf_dataload.processor import sync_mf_master_list
+
+
+class FakeMfApi:
+    def __init__(self, funds):
+        self.funds = funds
+
+    def get_all_funds(self):
+        return self.funds
+
+
+class SyncMfMasterListTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_manager = DatabaseManager(f"sqlite:///{Path(self.tmp.name) / 'mf.db'}")
+        self.db_manager.create_tables()
+
+    def tearDown(self):
+        self.db_manager.engine.dispose()
+        self.tmp.cleanup()
+
+    def securities(self):
+        with self.db_manager.Session() as session:
+            stmt = select(Security.symbol, Security.name, Security.isin, Security.valid_to).order_by(Security.id)
+            return [tuple(row) for row in session.execute(stmt)]
+
+    def test_isin_only_change_updates_row_in_place(self):
+        sync_mf_master_list(self.db_manager, FakeMfApi([
+            {"schemeCode": 100, "schemeName": "Alpha Fund", "isinGrowth": "INF000A01011"},
+        ]))
+        sync_mf_master_list(self.db_manager, FakeMfApi([
+            {"schemeCode": 100, "schemeName": "Alpha Fund", "isinGrowth": "INF000A01029"},
+        ]))
+
+        self.assertEqual(self.securities(), [("100", "Alpha Fund", "INF000A01029", None)])
+
+
+if __name__ == "__main__":
+    unittest.main()